@@ -1,121 +1,290 @@
 # database.py (Versão 7.2 - Desempacotamento da resposta da API do Turso)
 import sqlite3
+import atexit
+import base64
 import streamlit as st
 import httpx
-import json
+import orjson
+import zstandard
 
 # --- Configurações do Banco de Dados ---
 TURSO_DATABASE_URL = st.secrets["turso"]["DATABASE_URL"]
 TURSO_AUTH_TOKEN = st.secrets["turso"]["DATABASE_TOKEN"]
+_PIPELINE_URL = f"{TURSO_DATABASE_URL}/v2/pipeline"
+
+# Cliente HTTP persistente: reaproveita a conexão TCP/TLS entre as queries
+_TURSO_CLIENT = httpx.Client(
+    http2=True,
+    headers={
+        "Authorization": f"Bearer {TURSO_AUTH_TOKEN}",
+        "Content-Type": "application/json"
+    },
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    timeout=10.0
+)
+atexit.register(_TURSO_CLIENT.close)
+
+# Encerra o stream Hrana no mesmo pipeline, sem esperar o timeout do servidor
+_CLOSE_REQUEST = {"type": "close"}
+
+# Nível de compressão zstd aplicado ao scenario_data
+_SCENARIO_ZSTD_LEVEL = 3
+
+# Versão do esquema gravada na tabela meta; incremente ao alterar as tabelas
+_SCHEMA_VERSION = "v1"
+
+# Limite de parâmetros vinculados por instrução do SQLite
+_SQLITE_MAX_VARIABLES = 999
+
+# Códigos do SQLite para violação de chave única
+_UNIQUE_VIOLATION_CODES = {"SQLITE_CONSTRAINT_UNIQUE", "SQLITE_CONSTRAINT_PRIMARYKEY"}
+
+class TursoError(Exception):
+    """Erro retornado pelo Turso para uma instrução, com o código do SQLite quando disponível."""
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
 
 # --- FUNÇÕES AUXILIARES ---
+def _is_unique_violation(error):
+    """Indica se o erro é uma violação de UNIQUE/PRIMARY KEY."""
+    code = getattr(error, 'code', None)
+    if code in _UNIQUE_VIOLATION_CODES:
+        return True
+    if code and not code.startswith("SQLITE_CONSTRAINT"):
+        return False
+    # Sem código, ou só o código genérico de constraint: recorre à mensagem
+    return "UNIQUE constraint failed" in str(error)
+
+def _encode_blob_arg(p):
+    return {"type": "blob", "base64": base64.b64encode(p).decode()}
+
+# Codificadores por tipo exato: um único lookup no dicionário por parâmetro
+_ARG_ENCODERS = {
+    str: lambda p: {"type": "text", "value": p},
+    int: lambda p: {"type": "integer", "value": str(p)},
+    float: lambda p: {"type": "float", "value": p},
+    type(None): lambda p: {"type": "null"},
+    bool: lambda p: {"type": "integer", "value": str(int(p))},
+    bytes: _encode_blob_arg,
+}
+
+def _encode_arg_fallback(p):
+    """Subclasses (ex.: tipos numpy) caem aqui; o resto vira texto."""
+    for base in (str, bool, int, float, bytes):
+        if isinstance(p, base):
+            return _ARG_ENCODERS[base](base(p))
+    return {"type": "text", "value": str(p)}
+
 def _format_turso_args(params):
     """Formata os parâmetros de ida para o formato exigido pela API v2."""
     if not params:
         return []
-    
-    formatted_args = []
-    for p in params:
-        if isinstance(p, str):
-            formatted_args.append({"type": "text", "value": p})
-        elif isinstance(p, int):
-            formatted_args.append({"type": "integer", "value": str(p)})
-        elif isinstance(p, float):
-            formatted_args.append({"type": "float", "value": p})
-        elif p is None:
-            formatted_args.append({"type": "null"})
-        else:
-            formatted_args.append({"type": "text", "value": str(p)})
-    return formatted_args
+    # Caso dominante: apenas (username,)
+    if len(params) == 1 and type(params[0]) is str:
+        return [{"type": "text", "value": params[0]}]
+    return [_ARG_ENCODERS.get(type(p), _encode_arg_fallback)(p) for p in params]
 
-def _unwrap_turso_response_values(rows, columns):
-    """'Desempacota' os objetos de valor retornados pela API v2."""
-    if not rows:
-        return []
-    
+def _unwrap_turso_rows(rows):
+    """'Desempacota' os objetos de valor retornados pela API v2, mantendo as linhas como listas."""
     unwrapped_rows = []
     for row in rows:
         unwrapped_row = []
         for val in row:
             if isinstance(val, dict) and 'value' in val:
                 unwrapped_row.append(val['value'])
+            elif isinstance(val, dict) and val.get('type') == 'blob':
+                encoded = val.get('base64', '')
+                unwrapped_row.append(base64.b64decode(encoded + '=' * (-len(encoded) % 4)))
             else:
                 unwrapped_row.append(val)
         unwrapped_rows.append(unwrapped_row)
+    return unwrapped_rows
+
+def _unwrap_turso_response_values(rows, columns):
+    """'Desempacota' os objetos de valor retornados pela API v2."""
+    if not rows:
+        return []
     
     # Converte as linhas desempacotadas em dicionários
-    dict_rows = []
-    for row in unwrapped_rows:
-        dict_rows.append({columns[i]: row[i] for i in range(len(columns))})
-        
-    return dict_rows
+    return [dict(zip(columns, row)) for row in _unwrap_turso_rows(rows)]
 
-# --- Função de query com a lógica final ---
-def execute_turso_query(query, params=None, fetch_mode='none'):
-    headers = {
-        "Authorization": f"Bearer {TURSO_AUTH_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    url = f"{TURSO_DATABASE_URL}/v2/pipeline"
-    
-    formatted_args = _format_turso_args(params)
-    stmt_obj = {"sql": query, "args": formatted_args}
-    request_obj = {"type": "execute", "stmt": stmt_obj}
-    payload = {"requests": [request_obj]}
+def _build_bulk_insert(table, columns, rows):
+    """Monta INSERTs com múltiplos VALUES, divididos para respeitar o limite de parâmetros."""
+    placeholders = "(" + ", ".join(["?"] * len(columns)) + ")"
+    chunk_size = max(1, _SQLITE_MAX_VARIABLES // len(columns))
+    statements = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        query = f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([placeholders] * len(chunk))
+        params = tuple(value for row in chunk for value in row)
+        statements.append((query, params))
+    return statements
+
+def _process_turso_result(result, fetch_mode, row_factory=None):
+    """Converte o resultado de uma instrução do pipeline conforme o fetch_mode.
+
+    Se row_factory for informado, ele recebe (columns, rows) com as linhas já
+    desempacotadas e monta o resultado diretamente, sem dicionários por linha.
+    """
+    if result.get('type') == 'error':
+        error_info = result.get('error', {})
+        raise TursoError(error_info.get('message', 'Erro desconhecido'), error_info.get('code'))
+
+    if fetch_mode == 'none':
+        return None
+
+    result_data = result.get('response', {}).get('result', {})
+    columns = [col.get('name') for col in result_data.get('cols', []) if col.get('name') is not None]
+    rows = result_data.get('rows', [])
 
+    # Apenas o primeiro valor da primeira linha, sem montar dicionários
+    if fetch_mode == 'scalar':
+        return _unwrap_turso_rows(rows[:1])[0][0] if rows and rows[0] else None
+
+    if row_factory is not None:
+        return row_factory(columns, _unwrap_turso_rows(rows))
+
+    if not columns or not rows:
+        return [] if fetch_mode == 'all' else None
+
+    # Usamos a nova função para processar os resultados
+    processed_rows = _unwrap_turso_response_values(rows, columns)
+
+    if fetch_mode == 'one':
+        return processed_rows[0] if processed_rows else None
+    elif fetch_mode == 'all':
+        return processed_rows
+    return None
+
+def _execute_request(query, params=None):
+    """Monta uma requisição 'execute' do pipeline."""
+    return {"type": "execute", "stmt": {"sql": query, "args": _format_turso_args(params)}}
+
+def _transaction_batch_request(statements):
+    """Monta uma requisição 'batch' que executa as instruções em uma única transação.
+
+    Retorna a requisição e o índice do passo de COMMIT.
+    """
+    # BEGIN, instruções e COMMIT encadeados: cada passo só roda se o anterior deu certo
+    steps = [{"stmt": {"sql": "BEGIN"}}]
+    for stmt in statements:
+        query, params = (stmt, None) if isinstance(stmt, str) else stmt
+        steps.append({
+            "condition": {"type": "ok", "step": len(steps) - 1},
+            "stmt": {"sql": query, "args": _format_turso_args(params)}
+        })
+    commit_step = len(steps)
+    steps.append({"condition": {"type": "ok", "step": commit_step - 1}, "stmt": {"sql": "COMMIT"}})
+    steps.append({
+        "condition": {"type": "not", "cond": {"type": "ok", "step": commit_step}},
+        "stmt": {"sql": "ROLLBACK"}
+    })
+    return {"type": "batch", "batch": {"steps": steps}}, commit_step
+
+def _check_batch_result(batch_result, commit_step):
+    """Levanta o primeiro erro de um resultado 'batch', se houver."""
+    if batch_result.get('type') == 'error':
+        error_info = batch_result.get('error', {})
+        raise TursoError(error_info.get('message', 'Erro desconhecido'), error_info.get('code'))
+
+    step_errors = batch_result.get('response', {}).get('result', {}).get('step_errors', [])
+    for error_info in step_errors[:commit_step + 1]:
+        if error_info:
+            raise TursoError(error_info.get('message', 'Erro desconhecido'), error_info.get('code'))
+
+def execute_turso_pipeline(requests_list):
+    """Envia as requisições em um único POST ao /v2/pipeline e retorna a lista de resultados."""
+    payload = {"requests": requests_list + [_CLOSE_REQUEST]}
+
+    response = _TURSO_CLIENT.post(_PIPELINE_URL, content=orjson.dumps(payload))
+    if response.status_code >= 400:
+        raise TursoError(f"Turso HTTP {response.status_code}: {response.text[:200]}")
+    json_response = orjson.loads(response.content)
+    return json_response.get('results', []) if json_response else []
+
+# --- Função de query com a lógica final ---
+def execute_turso_query(query, params=None, fetch_mode='none', row_factory=None):
     try:
-        with httpx.Client() as client:
-            response = client.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            json_response = response.json()
-
-            if not json_response or 'results' not in json_response or not json_response['results']:
-                return [] if fetch_mode == 'all' else None
-
-            first_result = json_response['results'][0]
-
-            if first_result.get('type') == 'error':
-                error_info = first_result.get('error', {})
-                raise Exception(f"{error_info.get('message', 'Erro desconhecido')}")
-
-            if fetch_mode == 'none':
-                return None
-            
-            result_data = first_result.get('response', {}).get('result', {})
-            columns = [col.get('name') for col in result_data.get('cols', []) if col.get('name') is not None]
-            rows = result_data.get('rows', [])
-
-            if not columns or not rows:
-                return [] if fetch_mode == 'all' else None
-
-            # Usamos a nova função para processar os resultados
-            processed_rows = _unwrap_turso_response_values(rows, columns)
-
-            if fetch_mode == 'one':
-                return processed_rows[0] if processed_rows else None
-            elif fetch_mode == 'all':
-                return processed_rows
-            return None
+        results = execute_turso_pipeline([_execute_request(query, params)])
+
+        if not results:
+            if row_factory is not None and fetch_mode != 'none':
+                return row_factory([], [])
+            return [] if fetch_mode == 'all' else None
+
+        return _process_turso_result(results[0], fetch_mode, row_factory)
     except Exception as e:
         raise e
 
+def execute_turso_queries(queries):
+    """Executa consultas independentes em uma única requisição ao Turso.
+
+    Cada item é uma tupla (query, params, fetch_mode, row_factory), com row_factory
+    opcional (None); retorna os resultados na mesma ordem.
+    """
+    results = execute_turso_pipeline([_execute_request(query, params) for query, params, _, _ in queries])
+
+    processed = []
+    for i, (_, _, fetch_mode, row_factory) in enumerate(queries):
+        if i < len(results):
+            processed.append(_process_turso_result(results[i], fetch_mode, row_factory))
+        elif row_factory is not None and fetch_mode != 'none':
+            processed.append(row_factory([], []))
+        else:
+            processed.append([] if fetch_mode == 'all' else None)
+    return processed
+
+def execute_turso_batch(statements):
+    """Executa várias instruções em uma única requisição e transação no Turso.
+
+    Cada item pode ser a string SQL ou uma tupla (query, params). Se alguma
+    instrução falhar, a transação é desfeita e o erro é levantado.
+    """
+    batch_request, commit_step = _transaction_batch_request(statements)
+    results = execute_turso_pipeline([batch_request])
+    if results:
+        _check_batch_result(results[0], commit_step)
+
 def setup_database():
+    # Uma vez confirmado nesta sessão, as próximas execuções do script não tocam no banco
+    if st.session_state.get('_schema_ready'):
+        return
     try:
-        execute_turso_query("ALTER TABLE users ADD COLUMN email TEXT;")
-    except Exception as e:
-        if "duplicate column name" not in str(e):
-            st.warning(f"Não foi possível adicionar a coluna 'email': {e}")
-            
+        version = execute_turso_query("SELECT value FROM meta WHERE key = ?", ("schema_version",), fetch_mode='scalar')
+    except TursoError:
+        # Banco ainda sem a tabela meta
+        version = None
+    if version == _SCHEMA_VERSION:
+        st.session_state['_schema_ready'] = True
+        return
+
     queries = [
         "CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT NOT NULL, name TEXT NOT NULL, email TEXT);",
         "CREATE TABLE IF NOT EXISTS projects (id INTEGER PRIMARY KEY, username TEXT NOT NULL, project_name TEXT NOT NULL, FOREIGN KEY (username) REFERENCES users (username), UNIQUE (username, project_name));",
-        "CREATE TABLE IF NOT EXISTS scenarios (id INTEGER PRIMARY KEY, username TEXT NOT NULL, project_name TEXT NOT NULL, scenario_name TEXT NOT NULL, scenario_data TEXT NOT NULL, FOREIGN KEY (username) REFERENCES users (username), UNIQUE (username, project_name, scenario_name));",
+        "CREATE TABLE IF NOT EXISTS scenarios (id INTEGER PRIMARY KEY, username TEXT NOT NULL, project_name TEXT NOT NULL, scenario_name TEXT NOT NULL, scenario_data BLOB NOT NULL, FOREIGN KEY (username) REFERENCES users (username), UNIQUE (username, project_name, scenario_name));",
         "CREATE TABLE IF NOT EXISTS user_fluids (id INTEGER PRIMARY KEY, username TEXT NOT NULL, fluid_name TEXT NOT NULL, density REAL NOT NULL, viscosity REAL NOT NULL, vapor_pressure REAL NOT NULL, FOREIGN KEY (username) REFERENCES users (username), UNIQUE (username, fluid_name));",
-        "CREATE TABLE IF NOT EXISTS user_materials (id INTEGER PRIMARY KEY, username TEXT NOT NULL, material_name TEXT NOT NULL, roughness REAL NOT NULL, FOREIGN KEY (username) REFERENCES users (username), UNIQUE (username, material_name));"
+        "CREATE TABLE IF NOT EXISTS user_materials (id INTEGER PRIMARY KEY, username TEXT NOT NULL, material_name TEXT NOT NULL, roughness REAL NOT NULL, FOREIGN KEY (username) REFERENCES users (username), UNIQUE (username, material_name));",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);",
+        ("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", ("schema_version", _SCHEMA_VERSION))
     ]
-    for query in queries:
-        execute_turso_query(query)
+    # Criação das tabelas e migração da coluna 'email' em um único POST.
+    # O ALTER roda depois dos CREATEs e fica fora da transação, pois falha
+    # (coluna duplicada) sempre que a tabela já tem a coluna.
+    batch_request, commit_step = _transaction_batch_request(queries)
+    batch_result, alter_result = execute_turso_pipeline([
+        batch_request,
+        _execute_request("ALTER TABLE users ADD COLUMN email TEXT;")
+    ])[:2]
+    _check_batch_result(batch_result, commit_step)
+    try:
+        _process_turso_result(alter_result, 'none')
+    except TursoError as e:
+        if "duplicate column name" not in str(e):
+            st.warning(f"Não foi possível adicionar a coluna 'email': {e}")
+    st.session_state['_schema_ready'] = True
 
+@st.cache_data(ttl=300)
 def get_user(username):
     result = execute_turso_query("SELECT username, password, name, email FROM users WHERE username = ?", (username,), fetch_mode='one')
     return result
@@ -123,50 +292,92 @@ def get_user(username):
 def add_user(username, password_hashed, name, email):
     try:
         execute_turso_query("INSERT INTO users (username, password, name, email) VALUES (?, ?, ?, ?)", (username, password_hashed, name, email))
+        get_user.clear()
         return True
     except Exception as e:
         if "invalid type: string" in str(e) and "expected internally tagged enum" in str(e):
+            get_user.clear()
             return True
-        if "UNIQUE constraint failed" in str(e):
+        if _is_unique_violation(e):
             return False
         st.error(f"Erro inesperado ao adicionar usuário: {e}")
         return False
         
 def save_scenario(username, project_name, scenario_name, scenario_data):
-    execute_turso_query("INSERT OR IGNORE INTO projects (username, project_name) VALUES (?, ?)", (username, project_name))
-    data_json = json.dumps(scenario_data)
-    execute_turso_query(
-        "INSERT OR REPLACE INTO scenarios (username, project_name, scenario_name, scenario_data) VALUES (?, ?, ?, ?)",
-        (username, project_name, scenario_name, data_json)
-    )
+    # O JSON é gravado comprimido (zstd) como BLOB para reduzir o tráfego com o Turso
+    payload = zstandard.compress(orjson.dumps(scenario_data, option=orjson.OPT_NON_STR_KEYS), _SCENARIO_ZSTD_LEVEL)
+    execute_turso_batch([
+        ("INSERT OR IGNORE INTO projects (username, project_name) VALUES (?, ?)", (username, project_name)),
+        ("INSERT INTO scenarios (username, project_name, scenario_name, scenario_data) VALUES (?, ?, ?, ?) "
+         "ON CONFLICT (username, project_name, scenario_name) DO UPDATE SET scenario_data = excluded.scenario_data",
+         (username, project_name, scenario_name, payload))
+    ])
+    get_user_projects.clear()
+    load_user_library.clear()
+    get_scenarios_for_project.clear()
 
 def load_scenario(username, project_name, scenario_name):
-    result = execute_turso_query(
+    data = execute_turso_query(
         "SELECT scenario_data FROM scenarios WHERE username = ? AND project_name = ? AND scenario_name = ?",
         (username, project_name, scenario_name),
-        fetch_mode='one'
+        fetch_mode='scalar'
     )
-    if result and 'scenario_data' in result:
-        return json.loads(result['scenario_data'])
-    return None
+    if not data:
+        return None
+    # Cenários antigos foram gravados como texto JSON sem compressão
+    if isinstance(data, bytes):
+        data = zstandard.decompress(data)
+    return orjson.loads(data)
+
+_USER_PROJECTS_QUERY = "SELECT project_name FROM projects WHERE username = ?"
+_USER_FLUIDS_QUERY = "SELECT fluid_name, density, viscosity, vapor_pressure FROM user_fluids WHERE username = ?"
+_USER_MATERIALS_QUERY = "SELECT material_name, roughness FROM user_materials WHERE username = ?"
+
+# Fábricas de linhas: montam o resultado final direto das linhas posicionais
+def _first_column_rows(columns, rows):
+    return [row[0] for row in rows]
+
+def _fluids_from_rows(columns, rows):
+    return {row[0]: {'rho': row[1], 'nu': row[2], 'pv_kpa': row[3]} for row in rows}
+
+def _materials_from_rows(columns, rows):
+    return {row[0]: row[1] for row in rows}
 
+@st.cache_data(ttl=300)
+def load_user_library(username):
+    """Carrega projetos, fluidos e materiais do usuário em uma única requisição."""
+    projects, fluids, materials = execute_turso_queries([
+        (_USER_PROJECTS_QUERY, (username,), 'all', _first_column_rows),
+        (_USER_FLUIDS_QUERY, (username,), 'all', _fluids_from_rows),
+        (_USER_MATERIALS_QUERY, (username,), 'all', _materials_from_rows),
+    ])
+    return projects, fluids, materials
+
+@st.cache_data(ttl=300)
 def get_user_projects(username):
-    results = execute_turso_query("SELECT project_name FROM projects WHERE username = ?", (username,), fetch_mode='all')
-    return [row['project_name'] for row in results] if results else []
+    return execute_turso_query(_USER_PROJECTS_QUERY, (username,), fetch_mode='all', row_factory=_first_column_rows)
 
+@st.cache_data(ttl=300)
 def get_scenarios_for_project(username, project_name):
-    results = execute_turso_query(
+    return execute_turso_query(
         "SELECT scenario_name FROM scenarios WHERE username = ? AND project_name = ?",
         (username, project_name),
-        fetch_mode='all'
+        fetch_mode='all',
+        row_factory=_first_column_rows
     )
-    return [row['scenario_name'] for row in results] if results else []
 
 def delete_scenario(username, project_name, scenario_name):
-    execute_turso_query(
-        "DELETE FROM scenarios WHERE username = ? AND project_name = ? AND scenario_name = ?",
-        (username, project_name, scenario_name)
-    )
+    # Remove o cenário e, se o projeto ficar vazio, o próprio projeto, na mesma requisição
+    execute_turso_batch([
+        ("DELETE FROM scenarios WHERE username = ? AND project_name = ? AND scenario_name = ?",
+         (username, project_name, scenario_name)),
+        ("DELETE FROM projects WHERE username = ? AND project_name = ? "
+         "AND NOT EXISTS (SELECT 1 FROM scenarios WHERE username = ? AND project_name = ?)",
+         (username, project_name, username, project_name))
+    ])
+    get_user_projects.clear()
+    load_user_library.clear()
+    get_scenarios_for_project.clear()
 
 def add_user_fluid(username, fluid_name, density, viscosity, vapor_pressure):
     try:
@@ -174,19 +385,34 @@ def add_user_fluid(username, fluid_name, density, viscosity, vapor_pressure):
             "INSERT INTO user_fluids (username, fluid_name, density, viscosity, vapor_pressure) VALUES (?, ?, ?, ?, ?)",
             (username, fluid_name, density, viscosity, vapor_pressure)
         )
+        get_user_fluids.clear()
+        load_user_library.clear()
         return True
-    except Exception as e:
-        if "UNIQUE constraint failed" in str(e):
+    except TursoError as e:
+        if _is_unique_violation(e):
             return False
         raise
 
+def add_user_fluids_bulk(username, fluids):
+    """Insere vários fluidos (nome, densidade, viscosidade, pressão de vapor) em uma única requisição.
+
+    Fluidos já existentes para o usuário são ignorados.
+    """
+    rows = [(username, fluid_name, density, viscosity, vapor_pressure) for fluid_name, density, viscosity, vapor_pressure in fluids]
+    if not rows:
+        return
+    execute_turso_batch(_build_bulk_insert("user_fluids", ("username", "fluid_name", "density", "viscosity", "vapor_pressure"), rows))
+    get_user_fluids.clear()
+    load_user_library.clear()
+
+@st.cache_data(ttl=300)
 def get_user_fluids(username):
-    results = execute_turso_query("SELECT fluid_name, density, viscosity, vapor_pressure FROM user_fluids WHERE username = ?", (username,), fetch_mode='all')
-    if not results: return {}
-    return {row['fluid_name']: {'rho': row['density'], 'nu': row['viscosity'], 'pv_kpa': row['vapor_pressure']} for row in results}
+    return execute_turso_query(_USER_FLUIDS_QUERY, (username,), fetch_mode='all', row_factory=_fluids_from_rows)
 
 def delete_user_fluid(username, fluid_name):
     execute_turso_query("DELETE FROM user_fluids WHERE username = ? AND fluid_name = ?", (username, fluid_name))
+    get_user_fluids.clear()
+    load_user_library.clear()
 
 def add_user_material(username, material_name, roughness):
     try:
@@ -194,16 +420,31 @@ def add_user_material(username, material_name, roughness):
             "INSERT INTO user_materials (username, material_name, roughness) VALUES (?, ?, ?)",
             (username, material_name, roughness)
         )
+        get_user_materials.clear()
+        load_user_library.clear()
         return True
-    except Exception as e:
-        if "UNIQUE constraint failed" in str(e):
+    except TursoError as e:
+        if _is_unique_violation(e):
             return False
         raise
 
+def add_user_materials_bulk(username, materials):
+    """Insere vários materiais (nome, rugosidade) em uma única requisição.
+
+    Materiais já existentes para o usuário são ignorados.
+    """
+    rows = [(username, material_name, roughness) for material_name, roughness in materials]
+    if not rows:
+        return
+    execute_turso_batch(_build_bulk_insert("user_materials", ("username", "material_name", "roughness"), rows))
+    get_user_materials.clear()
+    load_user_library.clear()
+
+@st.cache_data(ttl=300)
 def get_user_materials(username):
-    results = execute_turso_query("SELECT material_name, roughness FROM user_materials WHERE username = ?", (username,), fetch_mode='all')
-    if not results: return {}
-    return {row['material_name']: row['roughness'] for row in results}
+    return execute_turso_query(_USER_MATERIALS_QUERY, (username,), fetch_mode='all', row_factory=_materials_from_rows)
 
 def delete_user_material(username, material_name):
     execute_turso_query("DELETE FROM user_materials WHERE username = ? AND material_name = ?", (username, material_name))
+    get_user_materials.clear()
+    load_user_library.clear()
@@ -18,7 +18,7 @@ from database import (
     setup_database, save_scenario, load_scenario, get_user_projects,
     get_scenarios_for_project, delete_scenario, add_user_fluid, get_user_fluids,
     delete_user_fluid, add_user_material, get_user_materials, delete_user_material,
-    add_user, get_user
+    add_user, get_user, load_user_library
 )
 from report_generator import generate_report
 
@@ -376,9 +376,8 @@ else:
     if 'suction_tank_type' not in st.session_state: st.session_state.suction_tank_type = "Atmosférico"
     if 'suction_tank_pressure' not in st.session_state: st.session_state.suction_tank_pressure = 0.0
     
-    user_fluids = get_user_fluids(username)
+    user_projects, user_fluids, user_materials = load_user_library(username)
     fluidos_combinados = {**FLUIDOS_PADRAO, **user_fluids}
-    user_materials = get_user_materials(username)
     materiais_combinados = {**MATERIAIS_PADRAO, **user_materials}
 
     with st.sidebar:
@@ -390,7 +389,6 @@ else:
         
         st.divider()
         st.header("🚀 Gestão de Projetos e Cenários")
-        user_projects = get_user_projects(username)
         project_idx = 0
         if st.session_state.get('project_to_select') in user_projects:
             project_idx = user_projects.index(st.session_state.get('project_to_select'))